@@ -2,10 +2,17 @@
 # ETL Pipeline
 # ========================
 
+import csv
 import logging
 from pathlib import Path
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pyarrow import csv as pa_csv
 from dotenv import load_dotenv
 
 from .utils.helpers import (
@@ -13,51 +20,150 @@ from .utils.helpers import (
     setup_logging,
     profile_dataframe,
     build_date_dimension,
-    apply_validations,
+    validation_mask,
+    check_drop_rate,
+    log_profile,
     connect_postgres,
+    execute_values_insert,
+    insert_date_dimension,
     load_dimension_table,
     load_fact_sales,
+    read_key_lookups,
 )
 
-def load_raw_data(config: Dict[str, Any], logger: logging.Logger) -> pd.DataFrame:
+# Runs of characters stripped from ID fields before casting to integers
+# (matching whole runs makes far fewer replacements than one char at a time)
+NON_DIGITS = r"[^0-9]+"
+
+# Arrow -> pandas dtype overrides: IDs and counts become nullable integers and
+# text stays in Arrow buffers instead of one Python object per value
+PANDAS_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.large_string(): pd.StringDtype("pyarrow"),
+}
+
+def read_raw_table(path: Path, ds_cfg: Dict[str, Any], wanted: Set[str], text_cols: Set[str]) -> pa.Table:
+    """
+    Read the raw input into an Arrow table, keeping only the `wanted` columns in file order.
+
+    Files ending in .parquet are read with pyarrow.parquet; anything else is parsed
+    as CSV, with `text_cols` (date and ID fields) left as strings so their cleaning
+    does not depend on the type Arrow would infer.
+    """
+    if path.suffix.lower() == ".parquet":
+        names = pq.read_schema(path).names
+        return pq.read_table(path, columns=[c for c in names if c in wanted], memory_map=True)
+
+    with open(path, "r", encoding=ds_cfg["encoding"], newline="") as f:
+        header = next(csv.reader(f, delimiter=ds_cfg["delimiter"]), [])
+    # Arrow skips a UTF-8 byte order mark (common in Excel exports); so must the header
+    if header:
+        header[0] = header[0].lstrip("\ufeff")
+
+    # Parse straight from a memory map: the OS pages the file in, with no
+    # intermediate copy into a read buffer
+    with pa.memory_map(str(path), "r") as source:
+        return pa_csv.read_csv(
+            source,
+            read_options=pa_csv.ReadOptions(
+                encoding=ds_cfg["encoding"],
+                block_size=int(ds_cfg.get("block_size_mb", 8) * 1024 * 1024),
+            ),
+            parse_options=pa_csv.ParseOptions(delimiter=ds_cfg["delimiter"]),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=[c for c in header if c in wanted],
+                column_types={col: pa.string() for col in text_cols},
+                strings_can_be_null=True,
+            ),
+        )
+
+def read_clean_table(config: Dict[str, Any], logger: logging.Logger) -> pa.Table:
     """
-    Load the raw CSV and perform cleaning.
+    Read the raw input and clean it in Arrow: parse the date column and
+    reduce ID fields to nullable integers.
     """
     csv_path = Path(config["data_source"]["csv_path"])
     logger.info("Loading raw data from: %s.", csv_path)
 
     cmap = config["column_map"]
     ds_cfg = config["data_source"]
-    id_dtype = {
-        cmap["transaction_id"]: "string",
-        cmap["buyer_id"]: "string",
-        cmap["item_id"]: "string",
-    }
-
-    df = pd.read_csv(
-        csv_path,
-        delimiter=ds_cfg["delimiter"],
-        encoding=ds_cfg["encoding"],
-        dtype=id_dtype,
-    )
-
+    id_cols = (cmap["transaction_id"], cmap["buyer_id"], cmap["item_id"])
     date_col = ds_cfg["date_column"]
     fmt = ds_cfg["date_format"]
-    df[date_col] = pd.to_datetime(df[date_col], format=fmt, errors="coerce")
-
-    # Clean ID fields
-    for col in (cmap["transaction_id"], cmap["buyer_id"], cmap["item_id"]):
-        df[col] = (df[col]
-            .astype("string")
-            .str.replace(r"[^0-9]", "", regex=True)
-            .replace({"": pd.NA})
-        )
-        df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
 
-    logger.info("Loaded dataset: %d rows.", df.shape[0])
+    table = read_raw_table(csv_path, ds_cfg, wanted={*cmap.values(), date_col}, text_cols={*id_cols, date_col})
+
+    def parse_dates(raw: pa.ChunkedArray) -> pa.ChunkedArray:
+        # Parse each distinct date string once with pandas (strict about impossible
+        # dates such as 31/02), then expand back to rows with an Arrow take
+        if not (pa.types.is_string(raw.type) or pa.types.is_large_string(raw.type)):
+            return pc.cast(raw, pa.timestamp("ns"))
+        distinct = pc.unique(raw)
+        parsed = pd.to_datetime(distinct.to_pandas(), format=fmt, errors="coerce")
+        parsed = pa.array(parsed, type=pa.timestamp("ns"), from_pandas=True)
+        dates = pc.take(parsed, pc.index_in(raw, value_set=distinct))
+
+        unparsed = dates.null_count - raw.null_count
+        if unparsed:
+            logger.warning("%d rows have a %s not matching %s; set to NaT.", unparsed, date_col, fmt)
+        return dates
+
+    def clean_ids(values: pa.ChunkedArray) -> pa.ChunkedArray:
+        # Keep digits only (empty -> null) before the cast; integer columns (typed
+        # Parquet input) only need the sign dropped to give the same result
+        if pa.types.is_integer(values.type):
+            return pc.cast(pc.abs_checked(values), pa.int64())
+        values = pc.replace_substring_regex(values.cast(pa.string()), pattern=NON_DIGITS, replacement="")
+        values = pc.if_else(pc.equal(values, ""), pa.scalar(None, pa.string()), values)
+        return pc.cast(values, pa.int64())
+
+    # Columns are cleaned independently and Arrow kernels release the GIL,
+    # so the date and ID columns are processed concurrently
+    cleaners = {date_col: parse_dates, **{col: clean_ids for col in id_cols}}
+    with ThreadPoolExecutor(max_workers=len(cleaners)) as pool:
+        futures = {col: pool.submit(clean, table.column(col)) for col, clean in cleaners.items()}
+    for col, future in futures.items():
+        table = table.set_column(table.schema.get_field_index(col), col, future.result())
+
+    logger.info("Loaded dataset: %d rows.", table.num_rows)
+    return table
+
+def load_raw_data(config: Dict[str, Any], logger: logging.Logger) -> pd.DataFrame:
+    """
+    Load the raw CSV (or Parquet file) and perform cleaning.
+
+    Only columns referenced by `column_map` and the date column are read.
+    """
+    table = read_clean_table(config, logger)
+
+    # self_destruct frees each Arrow column as soon as it has been converted
+    df = table.to_pandas(
+        types_mapper=PANDAS_TYPES.get,
+        split_blocks=True,
+        self_destruct=True,
+    )
+    del table
+
     profile_dataframe(df, logger, name="Raw Input")
     return df
 
+def iter_chunks(table: pa.Table, chunk_size: int, mask: Optional[np.ndarray] = None) -> Iterator[pd.DataFrame]:
+    """
+    Yield an Arrow table as pandas frames of at most `chunk_size` rows,
+    keeping only the rows selected by `mask` when one is given.
+
+    Only the chunk being processed is held in pandas; the table stays in compact Arrow buffers.
+    """
+    offset = 0
+    for batch in table.to_batches(max_chunksize=chunk_size):
+        if mask is not None:
+            # Filter each batch on its slice of the mask instead of copying the whole filtered table
+            selected = pa.array(mask[offset:offset + batch.num_rows])
+            offset += batch.num_rows
+            batch = batch.filter(selected)
+        yield batch.to_pandas(types_mapper=PANDAS_TYPES.get)
+
 def run_etl(config_path: str = "etl/etl_config.yaml") -> None:
     """
     Run the ETL process: load config, load and validate raw data,
@@ -74,109 +180,173 @@ def run_etl(config_path: str = "etl/etl_config.yaml") -> None:
     processed_dir = Path(config["paths"]["processed_dir"])
     processed_dir.mkdir(parents=True, exist_ok=True)
 
-    # Load data
-    df_raw = load_raw_data(config, logger)
-    cleaned_path = processed_dir / "orders_cleaned.csv"
-    df_raw.to_csv(cleaned_path, index=False)
-    logger.info("Saved cleaned data to %s.", cleaned_path)
+    cmap = config["column_map"]
+    item_cols = list(dict.fromkeys(cmap[c] for c in ("item_code", "item_id", "item_name", "category", "version")))
+    emit_snapshots = config["pipeline"].get("emit_snapshots", False)
+    output_format = config["paths"].get("output_format", "parquet")
+    if output_format not in ("parquet", "csv"):
+        raise ValueError("Unsupported output_format: must be 'parquet' or 'csv'")
 
-    # Build dimension tables
-    logger.info("Generating dimensions...")
+    def save(name: str, frame: pd.DataFrame) -> Path:
+        path = processed_dir / f"{name}.{output_format}"
+        if output_format == "csv":
+            frame.to_csv(path, index=False)
+        else:
+            frame.to_parquet(path, index=False, compression="snappy")
+        return path
 
-    dim_date = build_date_dimension(df_raw, config)
-    dim_date_path = processed_dir / "dim_date.csv"
-    dim_date.to_csv(dim_date_path, index=False)
+    # Snapshots are appended chunk by chunk to one open writer (or file) per output,
+    # under a partial name until validation has passed
+    writers: Dict[str, Any] = {}
 
-    dim_item = load_dimension_table(df_raw, config, dim="item", logger=logger)
-    dim_item_path = processed_dir / "dim_item.csv"
-    dim_item.to_csv(dim_item_path, index=False)
+    def partial_path(name: str) -> Path:
+        return processed_dir / f"{name}.{output_format}.partial"
 
-    dim_buyer = load_dimension_table(df_raw, config, dim="buyer", logger=logger)
-    dim_buyer_path = processed_dir / "dim_buyer.csv"
-    dim_buyer.to_csv(dim_buyer_path, index=False)
+    def write_snapshot(name: str, frame: pd.DataFrame) -> None:
+        writer = writers.get(name)
+        if output_format == "csv":
+            if writer is None:
+                writer = writers[name] = open(partial_path(name), "w", newline="", encoding="utf-8")
+            frame.to_csv(writer, index=False, header=writer.tell() == 0)
+            return
+        table = pa.Table.from_pandas(frame, schema=writer.schema if writer else None, preserve_index=False)
+        if writer is None:
+            writer = writers[name] = pq.ParquetWriter(partial_path(name), table.schema, compression="snappy")
+        writer.write_table(table)
 
-    logger.info("Saved dimension tables to %s.", processed_dir)
+    # The cleaned table is read whole into Arrow (memory stays proportional to the
+    # input); pandas only ever holds one chunk of it. The validation mask and the
+    # rejected rows are kept, and validated rows are re-streamed for loading
+    table = read_clean_table(config, logger)
+    chunk_size = config["pipeline"]["chunk_size"]
 
     logger.info("Validating fact data...")
-    df_validated, rejected = apply_validations(df_raw.copy(), config, logger)
-    validated_path = processed_dir / "validated_fact_data.csv"
-    df_validated.to_csv(validated_path, index=False)
-    logger.info("Saved validated rows to %s.", validated_path)
+    masks: List[np.ndarray] = []
+    rejected_parts: List[pd.DataFrame] = []
+    nulls: Optional[pd.Series] = None
+    dtypes: Optional[pd.Series] = None
+    # The profile is only worth its per-chunk null counts when INFO is logged
+    profile = logger.isEnabledFor(logging.INFO)
+    try:
+        try:
+            for chunk in iter_chunks(table, chunk_size):
+                if profile:
+                    chunk_nulls = len(chunk) - chunk.count()
+                    nulls = chunk_nulls if nulls is None else nulls + chunk_nulls
+                    dtypes = chunk.dtypes if dtypes is None else dtypes
 
+                mask = validation_mask(chunk, config)
+                masks.append(mask)
+                rejected_parts.append(chunk.loc[~mask])
+
+                if emit_snapshots:
+                    write_snapshot("orders_cleaned", chunk)
+                    write_snapshot("validated_fact_data", chunk.loc[mask])
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        if dtypes is not None:
+            log_profile(logger, "Raw Input", (table.num_rows, len(dtypes)), dtypes, nulls)
+        valid = np.concatenate(masks) if masks else np.zeros(0, dtype=bool)
+        n_valid = int(valid.sum())
+        check_drop_rate(table.num_rows, n_valid, config, logger)
+    except BaseException:
+        for name in writers:
+            partial_path(name).unlink(missing_ok=True)
+        raise
+
+    # Snapshots only appear under their final names once validation has passed
+    for name in writers:
+        partial_path(name).replace(processed_dir / f"{name}.{output_format}")
+    if emit_snapshots:
+        logger.info("Saved cleaned and validated snapshots to %s.", processed_dir)
+
+    rejected = pd.concat(rejected_parts, ignore_index=True) if rejected_parts else pd.DataFrame()
     if not rejected.empty:
-        rejected_path = processed_dir / "rejected_rows.csv"
-        rejected.to_csv(rejected_path, index=False)
+        rejected_path = save("rejected_rows", rejected)
         logger.info("Saved rejected rows to %s.", rejected_path)
     else:
         logger.info("No rejected rows from validation.")
 
+    # Build dimension tables. Items need every row for the attribute counts;
+    # dates and buyers only need their distinct values, hashed in Arrow
+    logger.info("Generating dimensions...")
+
+    def distinct(col: str) -> pd.DataFrame:
+        return pa.table({col: pc.unique(table.column(col))}).to_pandas(types_mapper=PANDAS_TYPES.get)
+
+    date_source = distinct(config["data_source"]["date_column"])
+    buyer_source = distinct(cmap["buyer_id"])
+    item_source = table.select(item_cols).to_pandas(types_mapper=PANDAS_TYPES.get)
+
+    def build_and_save(name: str, source: pd.DataFrame, builder: Callable[..., pd.DataFrame], *args: Any, **kwargs: Any) -> pd.DataFrame:
+        dim = builder(source, config, *args, **kwargs)
+        save(name, dim)
+        return dim
+
+    # The three dimensions are independent; build and write them concurrently
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        date_future = pool.submit(build_and_save, "dim_date", date_source, build_date_dimension)
+        item_future = pool.submit(build_and_save, "dim_item", item_source, load_dimension_table, dim="item", logger=logger)
+        buyer_future = pool.submit(build_and_save, "dim_buyer", buyer_source, load_dimension_table, dim="buyer", logger=logger)
+        dim_date = date_future.result()
+        dim_item = item_future.result()
+        dim_buyer = buyer_future.result()
+    del date_source, item_source, buyer_source
+
+    logger.info("Saved dimension tables to %s.", processed_dir)
+
     dry_run = config["pipeline"].get("dry_run", False)
     if dry_run:
         logger.info("DRY RUN complete:")
         logger.info("  - dim_date rows prepared: %d.", len(dim_date))
         logger.info("  - dim_item rows prepared: %d.", len(dim_item))
         logger.info("  - dim_buyer rows prepared: %d.", len(dim_buyer))
-        logger.info("  - fact rows validated: %d.", len(df_validated))
+        logger.info("  - fact rows validated: %d.", n_valid)
         logger.info("No data was written to the database because dry_run=True.")
         return
     
     # Load to PostgreSQL
     engine = connect_postgres(config["postgres"])
-    chunk_size = config["pipeline"]["chunk_size"]
     schema = config["postgres"]["schema"]
     to_sql_kwargs = dict(
         schema=schema,
         if_exists="append",
         index=False,
-        method="multi",
+        method=execute_values_insert,
         chunksize=chunk_size,
     )
 
     logger.info("Loading data into PostgreSQL...")
     with engine.begin() as conn:
-        # dim_date
-        existing_dates = pd.read_sql(f"SELECT full_date FROM {schema}.dim_date", conn)
-        if not existing_dates.empty:
-            existing_dates["full_date"] = pd.to_datetime(existing_dates["full_date"], errors="raise")
-        new_dates = (
-            dim_date.merge(existing_dates, on="full_date", how="left", indicator=True)
-            .query("_merge == 'left_only'")
-            .drop(columns=["_merge"])
-        )
-        if not new_dates.empty:
-            logger.info("Inserting %d new dim_date rows.", len(new_dates))
-            new_dates.to_sql("dim_date", conn, **to_sql_kwargs)
-        else:
-            logger.info("No new dim_date rows to insert.")
-
-        # dim_item
-        existing_items = pd.read_sql(f"SELECT item_code FROM {schema}.dim_item", conn)
-        new_items = (
-            dim_item.merge(existing_items, on="item_code", how="left", indicator=True)
-            .query("_merge == 'left_only'")
-            .drop(columns=["_merge"])
-        )
-        if not new_items.empty:
-            logger.info("Inserting %d new dim_item rows.", len(new_items))
-            new_items.to_sql("dim_item", conn, **to_sql_kwargs)
-        else:
-            logger.info("No new dim_item rows to insert.")
-
-        # dim_buyer
-        existing_buyers = pd.read_sql(f"SELECT buyer_id FROM {schema}.dim_buyer", conn)
-        new_buyers = (
-            dim_buyer.merge(existing_buyers, on="buyer_id", how="left", indicator=True)
-            .query("_merge == 'left_only'")
-            .drop(columns=["_merge"])
+        # dim_date is generated in the database from the calendar range
+        start, end = dim_date["full_date"].min().date(), dim_date["full_date"].max().date()
+        logger.info("Generating dim_date rows from %s to %s (existing dates are skipped).", start, end)
+        insert_date_dimension(conn, schema, start, end)
+
+        # Dimensions: rows whose natural key already exists are skipped by Postgres
+        for name, dim in (("dim_item", dim_item), ("dim_buyer", dim_buyer)):
+            if dim.empty:
+                logger.info("No %s rows to insert.", name)
+                continue
+            logger.info("Inserting %d %s rows (existing keys are skipped).", len(dim), name)
+            dim.to_sql(name, conn, **to_sql_kwargs)
+
+        # fact_sales in COPY-sized batches; the dimensions are complete at
+        # this point, so their keys are read once for all batches
+        lookups = read_key_lookups(conn, schema)
+        copy_chunk_size = config["pipeline"].get("copy_chunk_size", 50000)
+        loaded = sum(
+            load_fact_sales(part, conn, config, logger, lookups=lookups)
+            for part in iter_chunks(table, copy_chunk_size, mask=valid)
         )
-        if not new_buyers.empty:
-            logger.info("Inserting %d new dim_buyer rows.", len(new_buyers))
-            new_buyers.to_sql("dim_buyer", conn, **to_sql_kwargs)
-        else:
-            logger.info("No new dim_buyer rows to insert.")
 
-        # fact_sales
-        load_fact_sales(df_validated, conn, config, logger)
+    dropped = n_valid - loaded
+    if dropped:
+        logger.warning("%d rows dropped due to missing FK references or transaction_id.", dropped)
+    logger.info("Final fact_sales row count: %d.", loaded)
+    logger.info("Loaded fact_sales into database.")
 
     logger.info("ETL process completed successfully.")
 
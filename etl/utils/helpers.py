@@ -3,19 +3,36 @@
 # ======================================
 
 import os
+import io
+import csv
+import copy
 import logging
-from typing import Any, Dict, Tuple
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import yaml
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from psycopg2.extras import execute_values
+from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 
+@lru_cache(maxsize=8)
+def _read_yaml(path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
 def load_config(path: str) -> Dict[str, Any]:
     """
     Load configuration from the given file path.
+
+    The parsed YAML is cached per file version (mtime and size), so repeated
+    runs skip the parse; each caller gets its own copy to modify.
     """
-    with open(path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return copy.deepcopy(_read_yaml(path, stat.st_mtime_ns, stat.st_size))
 
 def setup_logging(config: Dict[str, Any]) -> logging.Logger:
     """
@@ -46,12 +63,18 @@ def profile_dataframe(df: pd.DataFrame, logger: logging.Logger, name: str) -> No
     """
     Log profile information for a dataframe.
     """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    log_profile(logger, name, df.shape, df.dtypes, len(df) - df.count())
+
+def log_profile(logger: logging.Logger, name: str, shape: Tuple[int, int], dtypes: pd.Series, nulls: pd.Series) -> None:
+    """
+    Log profile information from precomputed dtypes and null counts (e.g. summed over chunks).
+    """
     logger.info("--- Profile: %s ---", name)
-    logger.info("Shape: %s", df.shape)
-    for col in df.columns:
-        nulls = df[col].isna().sum()
-        dtype = df[col].dtype
-        logger.info(" - %s: %s, nulls: %d.", col, dtype, nulls)
+    logger.info("Shape: %s", shape)
+    for col, dtype, n_null in zip(dtypes.index, dtypes, nulls):
+        logger.info(" - %s: %s, nulls: %d.", col, dtype, n_null)
 
 def build_date_dimension(df: pd.DataFrame, config: Dict[str, Any]) -> pd.DataFrame:
     """
@@ -63,19 +86,45 @@ def build_date_dimension(df: pd.DataFrame, config: Dict[str, Any]) -> pd.DataFra
     if series.empty:
         raise ValueError("No valid dates found in column %r to build date dimension." % col)
 
-    min_date = series.min().date()
-    max_date = series.max().date()
-    dates = pd.date_range(start=min_date, end=max_date, freq="D")
+    # Derive calendar parts from day offsets since the epoch (1970-01-01 was a Thursday)
+    min_date = series.min().to_datetime64().astype("datetime64[D]")
+    max_date = series.max().to_datetime64().astype("datetime64[D]")
+    days = np.arange(min_date, max_date + 1, dtype="datetime64[D]")
+    months = days.astype("datetime64[M]")
+    month_index = months.astype(np.int64)
+    month = (month_index % 12 + 1).astype(np.int32)
     date_dim = pd.DataFrame({
-        "full_date": dates,
-        "year": dates.year,
-        "quarter": dates.quarter,
-        "month": dates.month,
-        "day": dates.day,
-        "is_weekend": dates.weekday >= 5,
+        "full_date": days.astype("datetime64[ns]"),
+        "year": (month_index // 12 + 1970).astype(np.int32),
+        "quarter": (month - 1) // 3 + 1,
+        "month": month,
+        "day": ((days - months).astype(np.int64) + 1).astype(np.int32),
+        "is_weekend": (days.astype(np.int64) + 3) % 7 >= 5,
     })
     return date_dim
 
+def insert_date_dimension(conn: Any, schema: str, start: Any, end: Any) -> None:
+    """
+    Populate dim_date between start and end (inclusive) with a server-side generate_series.
+
+    Dates that already exist are skipped, so no calendar rows are sent from Python.
+    """
+    conn.execute(
+        text(f"""
+            INSERT INTO {schema}.dim_date (full_date, year, quarter, month, day, is_weekend)
+            SELECT
+                d::date,
+                EXTRACT(YEAR FROM d)::smallint,
+                EXTRACT(QUARTER FROM d)::smallint,
+                EXTRACT(MONTH FROM d)::smallint,
+                EXTRACT(DAY FROM d)::smallint,
+                EXTRACT(ISODOW FROM d) >= 6
+            FROM generate_series(CAST(:start AS date), CAST(:end AS date), INTERVAL '1 day') AS d
+            ON CONFLICT (full_date) DO NOTHING
+        """),
+        {"start": start, "end": end},
+    )
+
 def load_dimension_table(df: pd.DataFrame, config: Dict[str, Any], dim: str, logger: logging.Logger) -> pd.DataFrame:
     """
     Build a dimension table for "item" or "buyer" from the input data.
@@ -84,30 +133,47 @@ def load_dimension_table(df: pd.DataFrame, config: Dict[str, Any], dim: str, log
 
     if dim == "item":
         cols = ["item_code", "item_id", "item_name", "category", "version"]
-        item_df = df[[cmap[c] for c in cols]].copy()
-        item_df.columns = cols
+        # Select the mapped columns under their canonical names without copying;
+        # columns are only ever replaced below, never modified in place
+        item_df = pd.DataFrame({c: df[cmap[c]] for c in cols}, copy=False)
 
         item_df["item_id"] = pd.to_numeric(item_df["item_id"], errors="coerce").astype("Int64")
         if config["pipeline"]["canonicalize"].get("category"):
-            item_df["category"] = (item_df["category"]
-                .astype("string")
+            # Canonicalize each distinct category once, then expand back by code (-1 -> NA)
+            codes, uniques = pd.factorize(item_df["category"])
+            canon = (pd.Series(uniques, dtype="string")
                 .str.strip()
                 .str.replace(r"\s+", " ", regex=True)
                 .str.title()
             )
+            item_df["category"] = pd.Series(canon.array.take(codes, allow_fill=True), index=item_df.index)
 
         strat = config["pipeline"]["canonicalize"]["item_attributes"]
         if strat == "mode":
-            def canon(series: pd.Series):
-                mode = series.mode()
-                return mode.iloc[0] if not mode.empty else series.iloc[0]
-
-            grouped = (item_df.groupby("item_code").agg({
-                "item_id": "first",
-                "item_name": canon,
-                "category": canon,
-                "version": canon,
-            }).reset_index())
+            # Most frequent value per item_code, counted on integer codes instead of strings.
+            # Sorted factorization keeps code order = value order, so ties still go to the
+            # smallest value like Series.mode()
+            item_codes, item_values = pd.factorize(item_df["item_code"], sort=True)
+
+            def mode_by_code(col: str) -> pd.Series:
+                codes, uniques = pd.factorize(item_df[col], sort=True)
+                valid = (item_codes >= 0) & (codes >= 0)
+
+                # One int64 key per (item, value) pair, counted in a single sort
+                pairs, counts = np.unique(item_codes[valid].astype(np.int64) * len(uniques) + codes[valid], return_counts=True)
+                items, values = np.divmod(pairs, len(uniques))
+
+                # Stable sort by item, then count descending: the first row of each item is its mode
+                order = np.lexsort((-counts, items))
+                items, values = items[order], values[order]
+                first = np.ones(len(items), dtype=bool)
+                first[1:] = items[1:] != items[:-1]
+                return pd.Series(uniques.take(values[first]), index=item_values.take(items[first]))
+
+            grouped = item_df.groupby("item_code").agg(item_id=("item_id", "first"))
+            for col in ("item_name", "category", "version"):
+                grouped[col] = mode_by_code(col)
+            grouped = grouped.reset_index()
 
             before = len(grouped)
             grouped = grouped.dropna(subset=["item_id"])
@@ -120,66 +186,153 @@ def load_dimension_table(df: pd.DataFrame, config: Dict[str, Any], dim: str, log
         return item_df
 
     elif dim == "buyer":
-        buyers = df[[cmap["buyer_id"]]].drop_duplicates()
-        buyers.columns = ["buyer_id"]
-        buyers["buyer_id"] = pd.to_numeric(buyers["buyer_id"], errors="coerce").astype("Int64")
+        # Deduplicate the raw column with a single hash pass before converting
+        ids = pd.to_numeric(pd.Series(df[cmap["buyer_id"]].unique()), errors="coerce").astype("Int64")
 
-        before = len(buyers)
-        buyers = buyers.dropna(subset=["buyer_id"])
-        dropped = before - len(buyers)
+        dropped = int(ids.isna().sum())
         if dropped:
             logger.warning("Dropped %d buyer rows with null buyer_id.", dropped)
+        buyers = pd.DataFrame({"buyer_id": ids.dropna().unique()})
         return buyers
 
     else:
         raise ValueError("Unsupported dimension: must be 'item' or 'buyer'")
 
-def load_fact_sales(df: pd.DataFrame, conn: Any, config: Dict[str, Any], logger: logging.Logger) -> None:
+def copy_insert(table: Any, conn: Any, keys: List[str], data_iter: Iterable) -> None:
     """
-    Build and load the fact_sales table.
+    Insert method for DataFrame.to_sql that streams rows with COPY FROM STDIN.
+    """
+    buf = io.StringIO()
+    csv.writer(buf).writerows(data_iter)
+    buf.seek(0)
+
+    target = f"{table.schema}.{table.name}" if table.schema else table.name
+    columns = ", ".join(f'"{k}"' for k in keys)
+    with conn.connection.cursor() as cur:
+        cur.copy_expert(f"COPY {target} ({columns}) FROM STDIN WITH CSV", buf)
+
+def execute_values_insert(table: Any, conn: Any, keys: List[str], data_iter: Iterable) -> None:
+    """
+    Insert method for DataFrame.to_sql that sends each chunk as one psycopg2 execute_values call.
+
+    Rows that violate a unique constraint (e.g. an existing natural key) are skipped
+    via ON CONFLICT DO NOTHING, so reloading a dimension is idempotent.
+    """
+    rows = list(data_iter)
+    target = f"{table.schema}.{table.name}" if table.schema else table.name
+    columns = ", ".join(f'"{k}"' for k in keys)
+    with conn.connection.cursor() as cur:
+        execute_values(cur, f"INSERT INTO {target} ({columns}) VALUES %s ON CONFLICT DO NOTHING", rows, page_size=max(len(rows), 1))
+
+def copy_select(query: str, conn: Any, column_types: Optional[Dict[str, pa.DataType]] = None) -> pd.DataFrame:
+    """
+    Read the result of a SELECT with COPY TO STDOUT, parsed by the Arrow CSV reader
+    (no per-row Python tuples as with a cursor fetch).
+    """
+    buf = io.BytesIO()
+    with conn.connection.cursor() as cur:
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", buf)
+    buf.seek(0)
+
+    convert = pa_csv.ConvertOptions(column_types=column_types or {})
+    return pa_csv.read_csv(buf, convert_options=convert).to_pandas()
+
+def read_key_lookups(conn: Any, schema: str) -> Dict[str, pd.Series]:
+    """
+    Read the surrogate keys of each dimension as Series indexed by natural key,
+    keyed like `column_map` ("date", "item_code", "buyer_id").
+    """
+    # COPY writes dates in the session DateStyle; to_char pins the ISO form Arrow parses
+    dim_date = copy_select(
+        f"SELECT to_char(full_date, 'YYYY-MM-DD') AS full_date, date_key FROM {schema}.dim_date", conn,
+        column_types={"full_date": pa.date32(), "date_key": pa.int32()},
+    )
+    dim_item = copy_select(
+        f"SELECT item_code, item_key FROM {schema}.dim_item", conn,
+        column_types={"item_code": pa.string(), "item_key": pa.int32()},
+    )
+    dim_buyer = copy_select(
+        f"SELECT buyer_id, buyer_key FROM {schema}.dim_buyer", conn,
+        column_types={"buyer_id": pa.int64(), "buyer_key": pa.int32()},
+    )
+    dim_date["full_date"] = pd.to_datetime(dim_date["full_date"], errors="raise")
+
+    # Series.map reuses the index hash table; a dict would be rebuilt into one on every call
+    return {
+        "date": dim_date.set_index("full_date")["date_key"],
+        "item_code": dim_item.set_index("item_code")["item_key"],
+        "buyer_id": dim_buyer.set_index("buyer_id")["buyer_key"],
+    }
+
+def load_fact_sales(
+    df: pd.DataFrame,
+    conn: Any,
+    config: Dict[str, Any],
+    logger: logging.Logger,
+    lookups: Optional[Dict[str, pd.Series]] = None,
+) -> int:
+    """
+    Build and load one batch of the fact_sales table; returns the number of rows loaded.
+
+    Pass `lookups` from `read_key_lookups` when loading several chunks so the
+    dimensions are read once; otherwise they are read here. Totals are left to
+    the caller, so per-batch messages are logged at DEBUG.
     """
     cmap = config["column_map"]
     schema = config["postgres"]["schema"]
-    chunk_size = config["pipeline"]["chunk_size"]
+    copy_chunk_size = config["pipeline"].get("copy_chunk_size", 50000)
 
-    # Load dimension tables with keys
-    dim_date = pd.read_sql(f"SELECT * FROM {schema}.dim_date", conn)
-    dim_item = pd.read_sql(f"SELECT * FROM {schema}.dim_item", conn)
-    dim_buyer = pd.read_sql(f"SELECT * FROM {schema}.dim_buyer", conn)
-    dim_date["full_date"] = pd.to_datetime(dim_date["full_date"], errors="raise")
-    
-    # Join to get surrogate keys
-    df = df.merge(dim_date[["full_date", "date_key"]], how="left", left_on=cmap["date"], right_on="full_date")
-    df = df.merge(dim_item[["item_code", "item_key"]], how="left", left_on=cmap["item_code"], right_on="item_code")
-    df = df.merge(dim_buyer[["buyer_id", "buyer_key"]], how="left", left_on=cmap["buyer_id"], right_on="buyer_id")
+    if lookups is None:
+        lookups = read_key_lookups(conn, schema)
 
-    missing = df[df[["date_key", "item_key", "buyer_key"]].isnull().any(axis=1)]
-    if not missing.empty:
-        logger.warning("%d rows dropped due to missing FK references.", missing.shape[0])
+    # Resolve surrogate keys with one indexed lookup per dimension (keys and counts fit INTEGER columns)
+    date_key = df[cmap["date"]].map(lookups["date"])
+    item_key = df[cmap["item_code"]].map(lookups["item_code"])
+    buyer_key = df[cmap["buyer_id"]].map(lookups["buyer_id"])
 
-    fact = pd.DataFrame({
-        "date_key": df["date_key"],
-        "item_key": df["item_key"],
-        "buyer_key": df["buyer_key"],
-        "transaction_id": pd.to_numeric(df[cmap["transaction_id"]], errors="coerce").astype("Int64"),
-        "final_quantity": df[cmap["final_quantity"]].astype("Int64"),
-        "total_revenue": df[cmap["total_revenue"]].astype(float),
-        "price_reductions": df[cmap["price_reductions"]].astype(float),
-        "refunds": df[cmap["refunds"]].astype(float),
-        "final_revenue": df[cmap["final_revenue"]].astype(float),
-        "sales_tax": df[cmap["sales_tax"]].astype(float),
-        "overall_revenue": df[cmap["overall_revenue"]].astype(float),
-        "refunded_item_count": df[cmap["refunded_item_count"]].astype("Int64"),
-        "purchased_item_count": df[cmap["purchased_item_count"]].astype("Int64")
-    }).dropna(subset=["date_key", "item_key", "buyer_key", "transaction_id"])
-
-    logger.info("Final fact_sales row count: %d.", fact.shape[0])
-    fact.to_sql("fact_sales", conn, schema=schema, if_exists="append", index=False, method="multi", chunksize=chunk_size)
-    logger.info("Loaded fact_sales into database.")
+    missing = date_key.isna() | item_key.isna() | buyer_key.isna()
+    if missing.any():
+        logger.debug("%d rows in batch dropped due to missing FK references.", int(missing.sum()))
 
-def apply_validations(df: pd.DataFrame, config: Dict[str, Any], logger: logging.Logger) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    transaction_id = pd.to_numeric(df[cmap["transaction_id"]], errors="coerce").astype("Int64")
+    keep = (~missing & transaction_id.notna()).to_numpy()
+
+    def money(key: str) -> np.ndarray:
+        return df[cmap[key]].to_numpy(dtype=np.float64, na_value=np.nan)[keep]
+
+    def count(key: str) -> pd.api.extensions.ExtensionArray:
+        # Int32 casts wrap silently, so out-of-range counts are rejected first
+        values = df[cmap[key]].array[keep]
+        present = values[~pd.isna(values)]
+        bounds = np.iinfo(np.int32)
+        if len(present) and (present.min() < bounds.min or present.max() > bounds.max):
+            raise ValueError(f"Column {cmap[key]!r} has values outside the INTEGER range of fact_sales.")
+        return values.astype("Int32")
+
+    # Assemble from pre-typed arrays: one allocation per column, no index alignment
+    fact = pd.DataFrame({
+        "date_key": date_key.to_numpy()[keep].astype(np.int32),
+        "item_key": item_key.to_numpy()[keep].astype(np.int32),
+        "buyer_key": buyer_key.to_numpy()[keep].astype(np.int32),
+        "transaction_id": transaction_id.array[keep],
+        "final_quantity": count("final_quantity"),
+        "total_revenue": money("total_revenue"),
+        "price_reductions": money("price_reductions"),
+        "refunds": money("refunds"),
+        "final_revenue": money("final_revenue"),
+        "sales_tax": money("sales_tax"),
+        "overall_revenue": money("overall_revenue"),
+        "refunded_item_count": count("refunded_item_count"),
+        "purchased_item_count": count("purchased_item_count"),
+    }, copy=False)
+
+    fact.to_sql("fact_sales", conn, schema=schema, if_exists="append", index=False, method=copy_insert, chunksize=copy_chunk_size)
+    logger.debug("Loaded %d fact_sales rows from a batch of %d.", fact.shape[0], len(df))
+    return fact.shape[0]
+
+def validation_mask(df: pd.DataFrame, config: Dict[str, Any]) -> np.ndarray:
     """
-    Apply validation rules defined in the config to data.
+    Evaluate the validation rules enabled in the config; True marks rows that pass.
 
     Rules:
     - revenue_balance: final_revenue ≈ total_revenue + price_reductions + refunds
@@ -190,26 +343,47 @@ def apply_validations(df: pd.DataFrame, config: Dict[str, Any], logger: logging.
     cmap = config["column_map"]
     checks = config["validation"]["checks"]
     tolerance = config["validation"]["tolerance"]
-    df_original = df.copy()
-    start_rows = len(df)
 
-    if checks.get("revenue_balance"):
-        df["chk_rev1"] = df[cmap["total_revenue"]] + df[cmap["price_reductions"]] + df[cmap["refunds"]]
-        df = df[(df[cmap["final_revenue"]] - df["chk_rev1"]).abs() <= tolerance].copy()
+    # Each column is converted to float64 once, even when several rules use it
+    converted: Dict[str, np.ndarray] = {}
+
+    def values(key: str) -> np.ndarray:
+        if key not in converted:
+            converted[key] = df[cmap[key]].to_numpy(dtype=np.float64, na_value=np.nan)
+        return converted[key]
 
+    # Balance rules accumulate |actual - sum(parts)| in one scratch buffer instead
+    # of allocating a temporary per operation
+    scratch = np.empty(len(df), dtype=np.float64)
+
+    def imbalance(actual: str, *parts: str) -> np.ndarray:
+        np.copyto(scratch, values(parts[0]))
+        for key in parts[1:]:
+            np.add(scratch, values(key), out=scratch)
+        np.subtract(values(actual), scratch, out=scratch)
+        return np.abs(scratch, out=scratch)
+
+    # One boolean mask for all rules, evaluated on raw float64 arrays (NaN never passes)
+    mask = np.ones(len(df), dtype=bool)
+
+    if checks.get("revenue_balance"):
+        mask &= imbalance("final_revenue", "total_revenue", "price_reductions", "refunds") <= tolerance
 
     if checks.get("overall_balance"):
-        df["chk_rev2"] = df[cmap["final_revenue"]] + df[cmap["sales_tax"]]
-        df = df[(df[cmap["overall_revenue"]] - df["chk_rev2"]).abs() <= tolerance].copy()
+        mask &= imbalance("overall_revenue", "final_revenue", "sales_tax") <= tolerance
 
     if checks.get("quantity_balance"):
-        df["chk_qty"] = df[cmap["purchased_item_count"]] + df[cmap["refunded_item_count"]]
-        df = df[df[cmap["final_quantity"]] == df["chk_qty"]].copy()
+        mask &= imbalance("final_quantity", "purchased_item_count", "refunded_item_count") == 0
 
     if checks.get("refunded_nonpositive"):
-        df = df[df[cmap["refunded_item_count"]] <= 0].copy()
+        mask &= values("refunded_item_count") <= 0
 
-    end_rows = len(df)
+    return mask
+
+def check_drop_rate(start_rows: int, end_rows: int, config: Dict[str, Any], logger: logging.Logger) -> None:
+    """
+    Log the post-validation row count and raise if the drop rate exceeds max_error_rate.
+    """
     dropped = start_rows - end_rows
     drop_rate = dropped / max(start_rows, 1)
     logger.info("Post-validation row count: %d (dropped %d, %.2f%%).", end_rows, dropped, drop_rate * 100.0)
@@ -219,10 +393,28 @@ def apply_validations(df: pd.DataFrame, config: Dict[str, Any], logger: logging.
         raise ValueError("Validation drop rate %.2f%% exceeds max_error_rate %.2f%%"
             % (drop_rate * 100.0, max_err * 100.0))
 
-    df_cleaned = df.drop(columns=[c for c in df.columns if c.startswith("chk_")])
-    rejected = df_original.loc[~df_original.index.isin(df_cleaned.index)]
+def apply_validations(df: pd.DataFrame, config: Dict[str, Any], logger: logging.Logger) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Apply validation rules defined in the config to data (see `validation_mask`).
+    """
+    mask = validation_mask(df, config)
+    df_cleaned = df.loc[mask]
+    check_drop_rate(len(df), len(df_cleaned), config, logger)
+
+    rejected = df.loc[~mask]
     return df_cleaned, rejected
 
+@lru_cache(maxsize=4)
+def _pooled_engine(url: str, insert_page_size: int, batch_page_size: int, pool_size: int) -> Engine:
+    return create_engine(
+        url,
+        executemany_mode="values_plus_batch",
+        insertmanyvalues_page_size=insert_page_size,
+        executemany_batch_page_size=batch_page_size,
+        pool_size=pool_size,
+        pool_pre_ping=True,
+    )
+
 def connect_postgres(pg_cfg: Dict[str, Any]) -> Engine:
     """
     Create a SQLAlchemy engine for PostgreSQL.
@@ -230,10 +422,20 @@ def connect_postgres(pg_cfg: Dict[str, Any]) -> Engine:
     Password resolution:
     - First, try DB_PASSWORD environment variable. 
     - If env var is not set, uses pg_cfg["password"].
+
+    The psycopg2 driver is used with batched executemany (execute_values for
+    INSERTs, execute_batch otherwise) and a small pre-pinged connection pool.
+    Engines are cached per connection URL and settings, so repeated runs in one
+    process reuse the same pool.
     """
     user = pg_cfg["user"]
     password = os.getenv("DB_PASSWORD", pg_cfg.get("password", ""))
     host = pg_cfg["host"]
     port = pg_cfg["port"]
     db = pg_cfg["database"]
-    return create_engine(f"postgresql://{user}:{password}@{host}:{port}/{db}")
+    return _pooled_engine(
+        f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{db}",
+        pg_cfg.get("insert_page_size", 10000),
+        pg_cfg.get("batch_page_size", 1000),
+        pg_cfg.get("pool_size", 4),
+    )
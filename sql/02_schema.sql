@@ -25,7 +25,7 @@ CREATE INDEX IF NOT EXISTS ix_dim_date_full_date ON c360.dim_date(full_date);
 -- Dimension: Item
 -- ------------------------------------------------------------
 CREATE TABLE IF NOT EXISTS c360.dim_item(
-    item_key BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    item_key INT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     item_code TEXT NOT NULL UNIQUE,
     item_id BIGINT NOT NULL,
     item_name TEXT NOT NULL,
@@ -40,7 +40,7 @@ CREATE INDEX IF NOT EXISTS ix_dim_item_category ON c360.dim_item(category);
 -- Dimension: Buyer
 -- ------------------------------------------------------------
 CREATE TABLE IF NOT EXISTS c360.dim_buyer(
-    buyer_key BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    buyer_key INT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     buyer_id BIGINT NOT NULL UNIQUE
 );
 
@@ -50,8 +50,8 @@ CREATE TABLE IF NOT EXISTS c360.dim_buyer(
 CREATE TABLE IF NOT EXISTS c360.fact_sales(
     fact_key BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
     date_key INT NOT NULL REFERENCES c360.dim_date(date_key),
-    item_key BIGINT NOT NULL REFERENCES c360.dim_item(item_key),
-    buyer_key BIGINT NOT NULL REFERENCES c360.dim_buyer(buyer_key),
+    item_key INT NOT NULL REFERENCES c360.dim_item(item_key),
+    buyer_key INT NOT NULL REFERENCES c360.dim_buyer(buyer_key),
     transaction_id BIGINT NOT NULL,
     final_quantity INTEGER NOT NULL,
     total_revenue NUMERIC(14,2) NOT NULL DEFAULT 0,
@@ -1,16 +1,59 @@
+from types import SimpleNamespace
 import pandas as pd
+import pyarrow as pa
 import pytest
 
 from etl.utils.helpers import (
+    load_config,
     setup_logging,
+    profile_dataframe,
     build_date_dimension,
     load_dimension_table,
     apply_validations,
     load_fact_sales,
+    read_key_lookups,
+    copy_insert,
+    copy_select,
+    execute_values_insert,
     connect_postgres,
 )
 
 
+# ------------- load_config -------------
+def test_load_config_returns_copies_and_sees_edits(tmp_path):
+    path = tmp_path / "config.yml"
+    path.write_text("pipeline:\n  chunk_size: 10\n", encoding="utf-8")
+
+    first = load_config(str(path))
+    first["pipeline"]["chunk_size"] = 99
+    assert load_config(str(path))["pipeline"]["chunk_size"] == 10
+
+    path.write_text("pipeline:\n  chunk_size: 200\n", encoding="utf-8")
+    assert load_config(str(path))["pipeline"]["chunk_size"] == 200
+
+# ---------- profile_dataframe ----------
+def test_profile_dataframe_logs_null_counts(caplog):
+    df = pd.DataFrame({
+        "amount": [1.0, None, 3.0],
+        "buyer": pd.array([None, None, 7], dtype="Int64"),
+    })
+    logger = setup_logging({"logging": {"level": "INFO", "log_to_file": False}})
+
+    with caplog.at_level("INFO"):
+        profile_dataframe(df, logger, name="Sample")
+
+    messages = [rec.getMessage() for rec in caplog.records]
+    assert " - amount: float64, nulls: 1." in messages
+    assert " - buyer: Int64, nulls: 2." in messages
+
+def test_profile_dataframe_skipped_when_info_disabled(caplog):
+    df = pd.DataFrame({"amount": [1.0, None]})
+    logger = setup_logging({"logging": {"level": "WARNING", "log_to_file": False}})
+
+    profile_dataframe(df, logger, name="Sample")
+
+    assert caplog.records == []
+
 # --------- build_date_dimension --------
 def _minimal_config_with_date_col(col_name):
     return {
@@ -36,6 +79,34 @@ def test_build_date_dimension_normal_case():
     for col in ["year", "quarter", "month", "day", "is_weekend"]:
         assert col in dim.columns
 
+def test_build_date_dimension_calendar_values():
+    df = pd.DataFrame({"order_date": pd.to_datetime(["1970-01-05", "1969-12-30"])})
+    dim = build_date_dimension(df, _minimal_config_with_date_col("order_date"))
+
+    # Across the epoch: year, quarter and month roll over on 1970-01-01 (a Thursday)
+    rows = dim.assign(full_date=dim["full_date"].dt.strftime("%Y-%m-%d")).to_dict("records")
+    assert rows == [
+        {"full_date": "1969-12-30", "year": 1969, "quarter": 4, "month": 12, "day": 30, "is_weekend": False},
+        {"full_date": "1969-12-31", "year": 1969, "quarter": 4, "month": 12, "day": 31, "is_weekend": False},
+        {"full_date": "1970-01-01", "year": 1970, "quarter": 1, "month": 1, "day": 1, "is_weekend": False},
+        {"full_date": "1970-01-02", "year": 1970, "quarter": 1, "month": 1, "day": 2, "is_weekend": False},
+        {"full_date": "1970-01-03", "year": 1970, "quarter": 1, "month": 1, "day": 3, "is_weekend": True},
+        {"full_date": "1970-01-04", "year": 1970, "quarter": 1, "month": 1, "day": 4, "is_weekend": True},
+        {"full_date": "1970-01-05", "year": 1970, "quarter": 1, "month": 1, "day": 5, "is_weekend": False},
+    ]
+
+def test_build_date_dimension_matches_pandas_calendar():
+    days = pd.date_range("1965-01-01", "2030-12-31")
+    df = pd.DataFrame({"order_date": [days[0], days[-1]]})
+    dim = build_date_dimension(df, _minimal_config_with_date_col("order_date"))
+
+    assert (dim["full_date"] == days).all()
+    assert (dim["year"] == days.year).all()
+    assert (dim["quarter"] == days.quarter).all()
+    assert (dim["month"] == days.month).all()
+    assert (dim["day"] == days.day).all()
+    assert (dim["is_weekend"] == (days.dayofweek >= 5)).all()
+
 def test_build_date_dimension_no_valid_dates():
     df = pd.DataFrame({"date": [pd.NaT, pd.NaT]})
     cfg = _minimal_config_with_date_col("date")
@@ -83,7 +154,10 @@ def test_load_dimension_table_with_mode_canonicalization(column_map, pipeline_co
 
     assert set(dim_item["item_code"]) == {"A", "B"}
     assert dim_item.loc[dim_item["item_code"] == "A", "item_id"].iloc[0] == 1
+    # One "item A" and one "ITEM A": the tie goes to the smallest value, like Series.mode()
+    assert dim_item.loc[dim_item["item_code"] == "A", "item_name"].iloc[0] == "ITEM A"
     assert set(dim_item["category"]) == {"Electronics", "Home Appliances"}
+    assert list(df["raw_category"]) == [" electronics ", "Electronics", "home APPLIANCES"]
 
 def test_load_dimension_table_drops_nulls_and_logs_warning(column_map, caplog):
     cfg = {"column_map": column_map, "pipeline": {}}
@@ -166,6 +240,8 @@ def test_apply_validations_normal_case(validation_config):
     assert len(cleaned) == 1
     assert len(rejected) == 1
     assert cleaned.iloc[0]["total"] == 100.0
+    assert list(cleaned.columns) == list(df.columns)
+    assert len(df) == 2
 
 def test_apply_validations_drop_rate_exceeds_max(validation_config):
     df = pd.DataFrame(
@@ -245,13 +321,15 @@ def test_load_fact_sales(monkeypatch, validation_config, caplog):
             return dim_buyer
         raise AssertionError("Unexpected query: " + query)
 
-    monkeypatch.setattr("etl.utils.helpers.pd.read_sql", fake_read_sql)
+    monkeypatch.setattr("etl.utils.helpers.copy_select", fake_read_sql)
 
     written = {}
 
     def fake_to_sql(self, name, conn, schema=None, if_exists=None, index=None, method=None, chunksize=None):
         written["name"] = name
         written["schema"] = schema
+        written["method"] = method
+        written["chunksize"] = chunksize
         written["df"] = self.copy()
 
     monkeypatch.setattr("etl.utils.helpers.pd.DataFrame.to_sql", fake_to_sql)
@@ -260,7 +338,9 @@ def test_load_fact_sales(monkeypatch, validation_config, caplog):
     logger = setup_logging({"logging": {"level": "INFO", "log_to_file": False}})
 
     with caplog.at_level("INFO"):
-        load_fact_sales(df, conn, cfg, logger)
+        loaded = load_fact_sales(df, conn, cfg, logger)
+
+    assert loaded == 2
 
     assert any("dim_date" in q for q in read_calls)
     assert any("dim_item" in q for q in read_calls)
@@ -268,9 +348,104 @@ def test_load_fact_sales(monkeypatch, validation_config, caplog):
 
     assert written["name"] == "fact_sales"
     assert written["schema"] == schema
+    assert written["method"] is copy_insert
+    assert written["chunksize"] == 50000
     fact_df = written["df"]
     assert list(fact_df.columns)[:4] == ["date_key", "item_key", "buyer_key", "transaction_id"]
     assert len(fact_df) == 2
+    assert str(fact_df["item_key"].dtype) == "int32"
+    assert str(fact_df["final_quantity"].dtype) == "Int32"
+
+    # Preloaded lookups skip the dimension reads
+    lookups = read_key_lookups(conn, schema)
+    read_calls.clear()
+    load_fact_sales(df, conn, cfg, logger, lookups=lookups)
+    assert read_calls == []
+    assert written["df"].equals(fact_df)
+
+    # Counts beyond INTEGER are rejected instead of wrapping around
+    df[cmap["final_quantity"]] = pd.array([1, 3_000_000_000], dtype="Int64")
+    with pytest.raises(ValueError, match="INTEGER range"):
+        load_fact_sales(df, conn, cfg, logger, lookups=lookups)
+
+# ------------- copy_insert -------------
+@pytest.fixture
+def fake_conn():
+    """
+    SQLAlchemy-style connection whose DB-API cursor records COPY statements:
+    COPY FROM data is captured, each COPY TO writes the next entry of `copy_output`.
+    """
+    class FakeCursor:
+        def __init__(self, conn):
+            self.conn = conn
+        def __enter__(self):
+            return self
+        def __exit__(self, exc_type, exc, tb):
+            return False
+        def copy_expert(self, sql, buf):
+            self.conn.sql.append(sql)
+            if "TO STDOUT" in sql:
+                buf.write(self.conn.copy_output.pop(0))
+            else:
+                self.conn.copy_data.append(buf.read())
+
+    class FakeConn:
+        def __init__(self):
+            self.connection = self
+            self.sql = []
+            self.copy_data = []
+            self.copy_output = []
+        def cursor(self):
+            return FakeCursor(self)
+
+    return FakeConn()
+
+def test_copy_insert_streams_csv_rows(fake_conn):
+    copy_insert(SimpleNamespace(schema="testschema", name="fact_sales"), fake_conn, ["date_key", "refunds"], iter([(1, 0.5), (2, None)]))
+
+    assert fake_conn.sql == ['COPY testschema.fact_sales ("date_key", "refunds") FROM STDIN WITH CSV']
+    assert fake_conn.copy_data[0].splitlines() == ["1,0.5", "2,"]
+
+# ------------- copy_select -------------
+def test_copy_select_parses_copy_output(fake_conn):
+    fake_conn.copy_output = [b"item_code,item_key\n007,1\nB,2\n"]
+
+    df = copy_select("SELECT item_code, item_key FROM s.dim_item", fake_conn, column_types={"item_code": pa.string()})
+
+    assert fake_conn.sql == ["COPY (SELECT item_code, item_key FROM s.dim_item) TO STDOUT WITH CSV HEADER"]
+    assert list(df["item_code"]) == ["007", "B"]
+    assert list(df["item_key"]) == [1, 2]
+
+def test_read_key_lookups_pins_iso_dates(fake_conn):
+    fake_conn.copy_output = [
+        b"full_date,date_key\n2024-01-15,1\n",
+        b"item_code,item_key\nA,1\n",
+        b"buyer_id,buyer_key\n10,1\n",
+    ]
+
+    lookups = read_key_lookups(fake_conn, "s")
+
+    assert fake_conn.sql[0] == (
+        "COPY (SELECT to_char(full_date, 'YYYY-MM-DD') AS full_date, date_key FROM s.dim_date) TO STDOUT WITH CSV HEADER"
+    )
+    assert lookups["date"][pd.Timestamp("2024-01-15")] == 1
+
+# -------- execute_values_insert --------
+def test_execute_values_insert_sends_one_page(monkeypatch, fake_conn):
+    captured = {}
+
+    def fake_execute_values(cur, sql, rows, page_size=None):
+        captured["sql"] = sql
+        captured["rows"] = rows
+        captured["page_size"] = page_size
+
+    monkeypatch.setattr("etl.utils.helpers.execute_values", fake_execute_values)
+
+    execute_values_insert(SimpleNamespace(schema="testschema", name="dim_buyer"), fake_conn, ["buyer_id"], iter([(1,), (2,), (3,)]))
+
+    assert captured["sql"] == 'INSERT INTO testschema.dim_buyer ("buyer_id") VALUES %s ON CONFLICT DO NOTHING'
+    assert captured["rows"] == [(1,), (2,), (3,)]
+    assert captured["page_size"] == 3
 
 # ----------- connect_postgres ----------
 def test_connect_postgres(monkeypatch):
@@ -289,3 +464,10 @@ def test_connect_postgres(monkeypatch):
     assert url.username == "testuser"
     assert url.database == "testdb"
     assert url.password == "from_env"
+    assert url.drivername == "postgresql+psycopg2"
+    assert engine.pool.size() == 4
+
+    # The engine (and its pool) is reused until the connection settings change
+    assert connect_postgres(cfg) is engine
+    monkeypatch.setenv("DB_PASSWORD", "rotated")
+    assert connect_postgres(cfg) is not engine
@@ -1,9 +1,10 @@
 import logging
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import pytest
 
-from etl.etl_pipeline import load_raw_data, run_etl
+from etl.etl_pipeline import iter_chunks, load_raw_data, read_clean_table, run_etl
 
 # ------------ load_raw_data ------------
 @pytest.fixture
@@ -49,6 +50,112 @@ def test_load_raw_data(simple_config, caplog):
     assert list(df["buyer"]) == [1, 2]
     assert list(df["item"]) == [10, 20]
 
+def test_load_raw_data_strips_every_non_digit_run(simple_config):
+    csv_path = simple_config["data_source"]["csv_path"]
+    pd.DataFrame(
+        {
+            "order_date": ["02/11/2025", "03/11/2025"],
+            "txn_id": ["T-1-2-3", "--"],
+            "buyer": ["b1x2", "b-2"],
+            "item": ["i-10", "i-20"],
+        }
+    ).to_csv(csv_path, index=False, sep=";")
+
+    df = load_raw_data(simple_config, logging.getLogger("test_logger"))
+
+    assert list(df["txn_id"].astype(object)) == [123, pd.NA]
+    assert list(df["buyer"]) == [12, 2]
+
+def test_load_raw_data_with_utf8_bom(simple_config):
+    csv_path = Path(simple_config["data_source"]["csv_path"])
+    csv_path.write_bytes("\ufeff".encode("utf-8") + csv_path.read_bytes())
+
+    df = load_raw_data(simple_config, logging.getLogger("test_logger"))
+
+    assert list(df.columns) == ["order_date", "txn_id", "buyer", "item"]
+    assert df["order_date"].min().strftime("%Y-%m-%d") == "2025-11-02"
+
+def test_load_raw_data_numeric_ids_keep_digits_only(simple_config):
+    csv_path = simple_config["data_source"]["csv_path"]
+    pd.DataFrame(
+        {
+            "order_date": ["02/11/2025", "03/11/2025", "03/11/2025", "03/11/2025"],
+            "txn_id": ["-5", "12.0", "3.5", "1e3"],
+            "buyer": [1, 2, 3, None],
+            "item": ["i-10", None, "7", "8"],
+        }
+    ).to_csv(csv_path, index=False, sep=";")
+
+    df = load_raw_data(simple_config, logging.getLogger("test_logger"))
+
+    # Same digits-only rule whatever type Arrow would infer for the column
+    assert df["txn_id"].tolist() == [5, 120, 35, 13]
+    assert df["buyer"].tolist() == [10, 20, 30, pd.NA]
+    assert df["item"].tolist() == [10, pd.NA, 7, 8]
+    assert all(str(df[c].dtype) == "Int64" for c in ("txn_id", "buyer", "item"))
+
+def test_load_raw_data_from_parquet(simple_config, tmp_path):
+    parquet_path = tmp_path / "raw_orders.parquet"
+    pd.DataFrame(
+        {
+            "order_date": pd.to_datetime(["2025-11-02", "2025-11-03"]),
+            "txn_id": ["#123", "ABC456"],
+            "buyer": [-1, 2],
+            "item": ["i-10", "i-20"],
+            "unused": ["x", "y"],
+        }
+    ).to_parquet(parquet_path, index=False)
+    simple_config["data_source"]["csv_path"] = str(parquet_path)
+
+    df = load_raw_data(simple_config, logging.getLogger("test_logger"))
+
+    assert list(df.columns) == ["order_date", "txn_id", "buyer", "item"]
+    assert df["order_date"].min().strftime("%Y-%m-%d") == "2025-11-02"
+    assert list(df["txn_id"]) == [123, 456]
+    assert list(df["buyer"]) == [1, 2]
+    assert str(df["item"].dtype) == "Int64"
+
+def test_load_raw_data_invalid_dates_become_nat(simple_config, caplog):
+    csv_path = simple_config["data_source"]["csv_path"]
+    pd.DataFrame(
+        {
+            "order_date": ["02/11/2025", "31/02/2025", "not a date", None, "02/11/2025"],
+            "txn_id": [1, 2, 3, 4, 5],
+            "buyer": [1, 2, 3, 4, 5],
+            "item": [1, 2, 3, 4, 5],
+        }
+    ).to_csv(csv_path, index=False, sep=";")
+
+    with caplog.at_level("WARNING"):
+        df = load_raw_data(simple_config, logging.getLogger("test_logger"))
+
+    assert df["order_date"].isna().tolist() == [False, True, True, True, False]
+    assert (df["order_date"].dropna() == pd.Timestamp("2025-11-02")).all()
+    assert [r.getMessage() for r in caplog.records] == ["2 rows have a order_date not matching %d/%m/%Y; set to NaT."]
+
+# ------------- iter_chunks -------------
+def test_iter_chunks_respects_chunk_size(simple_config):
+    csv_path = simple_config["data_source"]["csv_path"]
+    pd.DataFrame(
+        {
+            "order_date": ["02/11/2025"] * 5,
+            "txn_id": [f"#{i}" for i in range(5)],
+            "buyer": ["b-1"] * 5,
+            "item": ["i-10"] * 5,
+        }
+    ).to_csv(csv_path, index=False, sep=";")
+    table = read_clean_table(simple_config, logging.getLogger("test_logger"))
+
+    chunks = list(iter_chunks(table, chunk_size=2))
+
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert pd.concat(chunks)["txn_id"].tolist() == [0, 1, 2, 3, 4]
+    assert all(str(c["txn_id"].dtype) == "Int64" for c in chunks)
+
+    masked = list(iter_chunks(table, chunk_size=2, mask=np.array([True, False, False, True, True])))
+
+    assert [c["txn_id"].tolist() for c in masked] == [[0], [3], [4]]
+
 # --------------- run_etl ---------------
 def _write_full_config(tmp_path, csv_path):
     cfg_path = tmp_path / "etl_config.yaml"
@@ -117,9 +224,9 @@ def _write_full_config(tmp_path, csv_path):
     """)
     return cfg_path
 
-def test_run_etl_dry_run(tmp_path, caplog, monkeypatch):
-    csv_path = tmp_path / "orders.csv"
-    df = pd.DataFrame(
+@pytest.fixture
+def orders_df():
+    return pd.DataFrame(
         {
             "order_date": ["2025-11-02", "2025-11-03"],
             "item_code": ["A", "B"],
@@ -140,47 +247,52 @@ def test_run_etl_dry_run(tmp_path, caplog, monkeypatch):
             "purch_qty": [1, 2],
         }
     )
-    df.to_csv(csv_path, index=False)
+
+@pytest.mark.parametrize("output_format", ["parquet", "csv"])
+def test_run_etl_dry_run(orders_df, tmp_path, caplog, monkeypatch, output_format):
+    csv_path = tmp_path / "orders.csv"
+    orders_df.to_csv(csv_path, index=False)
     cfg_path = _write_full_config(tmp_path, csv_path)
+    text = cfg_path.read_text().replace("dry_run: true", "dry_run: true\n          emit_snapshots: true")
+    text = text.replace("/processed\"", f"/processed\"\n          output_format: {output_format}")
+    text = text.replace("chunk_size: 1000", "chunk_size: 1")
+    cfg_path.write_text(text)
     monkeypatch.setattr("etl.etl_pipeline.load_dotenv", lambda *a, **k: None)
     run_etl(str(cfg_path))
 
     processed_dir = tmp_path / "processed"
-    assert (processed_dir / "orders_cleaned.csv").exists()
-    assert (processed_dir / "dim_date.csv").exists()
-    assert (processed_dir / "dim_item.csv").exists()
-    assert (processed_dir / "dim_buyer.csv").exists()
-    assert (processed_dir / "validated_fact_data.csv").exists()
+    for name in ("orders_cleaned", "dim_date", "dim_item", "dim_buyer", "validated_fact_data"):
+        assert (processed_dir / f"{name}.{output_format}").exists()
+
+    read = pd.read_csv if output_format == "csv" else pd.read_parquet
+    assert len(read(processed_dir / f"orders_cleaned.{output_format}")) == 2
+    assert list(read(processed_dir / f"dim_item.{output_format}")["item_code"]) == ["A", "B"]
 
-    rejected_path = processed_dir / "rejected_rows.csv"
+    rejected_path = processed_dir / f"rejected_rows.{output_format}"
     assert not rejected_path.exists()
 
-    assert "DRY RUN complete" in caplog.text
+    assert any(r.getMessage() == "DRY RUN complete:" for r in caplog.records)
 
-def test_run_etl_non_dry_run(monkeypatch, tmp_path):
+def test_run_etl_failed_validation_leaves_no_snapshots(orders_df, tmp_path, monkeypatch):
     csv_path = tmp_path / "orders.csv"
-    df = pd.DataFrame(
-        {
-            "order_date": ["2025-11-02"],
-            "item_code": ["A"],
-            "item_id": [1],
-            "item_name": ["Item A"],
-            "category": ["cat a"],
-            "version": ["v1"],
-            "buyer_id": [10],
-            "transaction_id": [100],
-            "final_qty": [1],
-            "total_rev": [100.0],
-            "disc": [0.0],
-            "refunds": [0.0],
-            "final_rev": [100.0],
-            "tax": [10.0],
-            "overall_rev": [110.0],
-            "ref_qty": [0],
-            "purch_qty": [1],
-        }
-    )
-    df.to_csv(csv_path, index=False)
+    orders_df.loc[1, "final_rev"] = 999.0
+    orders_df.to_csv(csv_path, index=False)
+    cfg_path = _write_full_config(tmp_path, csv_path)
+    text = cfg_path.read_text().replace("dry_run: true", "dry_run: true\n          emit_snapshots: true")
+    text = text.replace("max_error_rate: 1.0", "max_error_rate: 0.0")
+    cfg_path.write_text(text)
+    monkeypatch.setattr("etl.etl_pipeline.load_dotenv", lambda *a, **k: None)
+
+    with pytest.raises(ValueError, match="max_error_rate"):
+        run_etl(str(cfg_path))
+
+    assert list((tmp_path / "processed").iterdir()) == []
+
+def test_run_etl_non_dry_run(orders_df, monkeypatch, tmp_path, caplog):
+    # The pipeline reads Parquet input as well; one order keeps the fake dims simple
+    csv_path = tmp_path / "orders.parquet"
+    df = orders_df.head(1)
+    df.to_parquet(csv_path, index=False)
 
     cfg_path = _write_full_config(tmp_path, csv_path)
     text = cfg_path.read_text().replace("dry_run: true", "dry_run: false")
@@ -190,6 +302,9 @@ def test_run_etl_non_dry_run(monkeypatch, tmp_path):
         def __init__(self):
             self.read_sql_calls = []
             self.to_sql_calls = []
+            self.execute_calls = []
+        def execute(self, statement, params=None):
+            self.execute_calls.append((str(statement), params))
 
     class DummyEngine:
         def begin(self):
@@ -231,17 +346,31 @@ def test_run_etl_non_dry_run(monkeypatch, tmp_path):
             )
         return pd.DataFrame()
 
-    monkeypatch.setattr("etl.etl_pipeline.pd.read_sql", fake_read_sql)
+    monkeypatch.setattr("etl.utils.helpers.copy_select", fake_read_sql)
 
     def fake_to_sql(self, name, conn, **k):
         conn.to_sql_calls.append(name)
         
     monkeypatch.setattr("etl.etl_pipeline.pd.DataFrame.to_sql", fake_to_sql)
 
-    run_etl(str(cfg_path))
+    with caplog.at_level("INFO"):
+        run_etl(str(cfg_path))
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert messages.count("Final fact_sales row count: 1.") == 1
+
+    processed_dir = tmp_path / "processed"
+    assert not (processed_dir / "orders_cleaned.parquet").exists()
+    assert not (processed_dir / "validated_fact_data.parquet").exists()
 
     conn = dummy_engine.conn
     assert any("dim_date" in q for q in conn.read_sql_calls)
     assert any("dim_item" in q for q in conn.read_sql_calls)
     assert any("dim_buyer" in q for q in conn.read_sql_calls)
-    assert any(name in ("dim_date", "dim_item", "dim_buyer", "fact_sales") for name in conn.to_sql_calls)
+    assert len(conn.read_sql_calls) == 3
+    assert any(name in ("dim_item", "dim_buyer", "fact_sales") for name in conn.to_sql_calls)
+    assert "dim_date" not in conn.to_sql_calls
+
+    sql, params = conn.execute_calls[0]
+    assert "generate_series" in sql and "dim_date" in sql
+    assert str(params["start"]) == "2025-11-02" and str(params["end"]) == "2025-11-02"